@@ -1,20 +1,32 @@
+import glob
+import hashlib
+import io
 import os
-from flask import Flask, request, jsonify, send_file, send_from_directory
+import tempfile
+import click
+from flask import Flask, request, jsonify, send_file, send_from_directory, abort
 from flask_cors import CORS
-from dotenv import load_dotenv
-from werkzeug.security import check_password_hash
+from werkzeug.exceptions import NotFound
 from werkzeug.utils import secure_filename
+from sqlalchemy import event, select, update
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import contains_eager, joinedload, load_only
+from dotenv import load_dotenv
+
+# ✅ load .env before utils reads JWT_SECRET at import time
+load_dotenv()
 
 from models import (
     db, User, Project, Milestone, Escrow,
     TokenHolding, Transaction, MarketplaceListing
 )
-from utils import create_jwt, get_auth_user, generate_tx_hash
+from utils import (
+    create_jwt, get_auth_user, generate_tx_hash, save_upload, verify_password,
+    cache_user, get_cached_user
+)
 from seed import seed_data
 from pdf_utils import generate_certificate_pdf
 
-load_dotenv()
-
 app = Flask(__name__)
 
 # ✅ CORS
@@ -30,24 +42,66 @@ CORS(
 app.config["SQLALCHEMY_DATABASE_URI"] = os.getenv("DATABASE_URL", "sqlite:///infrabondx.db")
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 
+# ✅ psycopg2: send executemany() INSERT/UPDATEs as multi-VALUES / batched pages
+if make_url(app.config["SQLALCHEMY_DATABASE_URI"]).get_driver_name() == "psycopg2":
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {"executemany_mode": "values_plus_batch"}
+
 # ✅ Upload folder
 UPLOAD_FOLDER = os.path.join(os.getcwd(), "uploads")
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
 
+# ✅ Generated certificates
+PDF_DIR = os.path.join(os.getcwd(), "generated_pdfs")
+os.makedirs(PDF_DIR, exist_ok=True)
+# ✅ reject oversized uploads before they are read (413)
+app.config["MAX_CONTENT_LENGTH"] = int(os.getenv("MAX_UPLOAD_MB", "16")) * 1024 * 1024
+
+# ✅ behind Apache/lighttpd (or nginx mapping X-Sendfile to X-Accel-Redirect)
+# let the web server ship file bytes instead of the Flask worker
+app.config["USE_X_SENDFILE"] = os.getenv("USE_X_SENDFILE", "0") == "1"
+
 db.init_app(app)
 
 
-# ✅ INIT DB + SEED ONCE
+# ✅ SQLite: WAL lets readers run alongside a writer, fewer fsyncs per commit
+def _set_sqlite_pragmas(dbapi_conn, _):
+    cur = dbapi_conn.cursor()
+    cur.execute("PRAGMA journal_mode=WAL")
+    cur.execute("PRAGMA synchronous=NORMAL")
+    cur.execute("PRAGMA temp_store=MEMORY")
+    cur.execute("PRAGMA mmap_size=268435456")
+    cur.close()
+
+
+with app.app_context():
+    if db.engine.dialect.name == "sqlite":
+        event.listen(db.engine, "connect", _set_sqlite_pragmas)
+
+
+# ✅ INIT DB ONCE (seeding is the separate `flask seed` command below)
 def init_db_once():
     with app.app_context():
         db.create_all()
-        seed_data()
+        # ✅ create_all() skips existing tables, so add any missing indexes
+        for table in db.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(db.engine, checkfirst=True)
 
 
 init_db_once()
 
 
+# ✅ run once per deployment, not on every boot:  flask seed
+@app.cli.command("seed")
+def seed_command():
+    """Insert the demo users, projects and milestones into an empty DB."""
+    if seed_data():
+        click.echo("Seeded demo data.")
+    else:
+        click.echo("Users already exist, skipping seed.")
+
+
 # ---------- ROOT ----------
 @app.get("/")
 def root():
@@ -71,13 +125,13 @@ def login():
     password = (data.get("password") or "").strip()
 
     user = User.query.filter_by(email=email).first()
-    if not user or not check_password_hash(user.password_hash, password):
+    if not user or not verify_password(user.password_hash, password):
         return jsonify({"error": "Invalid credentials"}), 401
 
     token = create_jwt(user.id, user.role)
     return jsonify({
         "token": token,
-        "user": {"id": user.id, "name": user.name, "email": user.email, "role": user.role}
+        "user": cache_user(user)
     })
 
 
@@ -87,11 +141,11 @@ def me():
     if not auth_user:
         return jsonify({"error": "Unauthorized"}), 401
 
-    user = User.query.get(auth_user["user_id"])
+    user = get_cached_user(auth_user["user_id"])
     if not user:
         return jsonify({"error": "User not found"}), 404
 
-    return jsonify({"id": user.id, "name": user.name, "email": user.email, "role": user.role})
+    return jsonify(user)
 
 
 # ---------- FILE UPLOAD ----------
@@ -112,12 +166,12 @@ def upload_file():
     if not filename:
         return jsonify({"error": "Invalid filename"}), 400
 
-    # ✅ unique file name (remove 0x from hash for clean filename)
-    unique_id = generate_tx_hash().replace("0x", "")
+    # ✅ unique file name (128 random bits as hex, no "0x" to strip)
+    unique_id = os.urandom(16).hex()
     unique_name = f"{unique_id}_{filename}"
 
     save_path = os.path.join(app.config["UPLOAD_FOLDER"], unique_name)
-    f.save(save_path)
+    save_upload(f, save_path)
 
     return jsonify({
         "message": "uploaded",
@@ -129,35 +183,29 @@ def upload_file():
 
 @app.get("/uploads/<path:filename>")
 def serve_uploaded_file(filename):
-    safe_name = secure_filename(filename)
-    file_path = os.path.join(app.config["UPLOAD_FOLDER"], safe_name)
-
-    if not os.path.exists(file_path):
+    # ✅ send_from_directory() safe_joins the path and 404s on traversal
+    try:
+        return send_from_directory(app.config["UPLOAD_FOLDER"], filename, as_attachment=False)
+    except NotFound:
         return jsonify({"error": "File not found"}), 404
 
-    return send_from_directory(app.config["UPLOAD_FOLDER"], safe_name, as_attachment=False)
+
+def project_columns(fields):
+    # ✅ SELECT only the columns an endpoint serializes
+    return load_only(*(getattr(Project, f) for f in fields))
 
 
 # ---------- PROJECTS (Investor Marketplace) ----------
 @app.get("/api/projects")
 def list_projects():
-    projects = Project.query.filter(Project.status == "ACTIVE").all()
+    projects = (
+        Project.query
+        .options(project_columns(Project.PUBLIC_FIELDS))
+        .filter(Project.status == "ACTIVE")
+        .all()
+    )
 
-    return jsonify([{
-        "id": p.id,
-        "title": p.title,
-        "category": p.category,
-        "location": p.location,
-        "description": p.description,
-        "funding_target": p.funding_target,
-        "funding_raised": p.funding_raised,
-        "token_price": p.token_price,
-        "roi_percent": p.roi_percent,
-        "tenure_months": p.tenure_months,
-        "risk_level": p.risk_level,
-        "risk_score": p.risk_score,
-        "status": p.status
-    } for p in projects])
+    return jsonify([p.to_dict() for p in projects])
 
 
 @app.get("/api/projects/<int:project_id>")
@@ -167,21 +215,7 @@ def project_details(project_id):
     if p.status == "FROZEN":
         return jsonify({"error": "Project unavailable"}), 403
 
-    return jsonify({
-        "id": p.id,
-        "title": p.title,
-        "category": p.category,
-        "location": p.location,
-        "description": p.description,
-        "funding_target": p.funding_target,
-        "funding_raised": p.funding_raised,
-        "token_price": p.token_price,
-        "roi_percent": p.roi_percent,
-        "tenure_months": p.tenure_months,
-        "risk_level": p.risk_level,
-        "risk_score": p.risk_score,
-        "status": p.status
-    })
+    return jsonify(p.to_dict())
 
 
 @app.get("/api/projects/<int:project_id>/milestones")
@@ -226,7 +260,7 @@ def invest():
     project_id = data.get("project_id")
     amount = int(data.get("amount", 0))
 
-    p = Project.query.get_or_404(project_id)
+    p = Project.query.with_for_update().get_or_404(project_id)
 
     if p.status != "ACTIVE":
         return jsonify({"error": "Project is not available for investment"}), 400
@@ -235,25 +269,28 @@ def invest():
     if tokens <= 0:
         return jsonify({"error": "Amount too low"}), 400
 
+    # ✅ do all reads up front so no autoflush fires between the writes
+    escrow = Escrow.query.filter_by(project_id=p.id).first()
+    holding = (
+        TokenHolding.query
+        .with_for_update()
+        .filter_by(user_id=auth_user["user_id"], project_id=p.id)
+        .first()
+    )
+
     tx_hash = generate_tx_hash()
 
+    # ✅ balances are flushed as "SET col = col + :amount", not read-modify-write
     # project funding
-    p.funding_raised += amount
+    p.funding_raised = Project.funding_raised + amount
 
     # escrow
-    escrow = Escrow.query.filter_by(project_id=p.id).first()
     if not escrow:
-        escrow = Escrow(project_id=p.id, total_locked=0, total_released=0)
-        db.session.add(escrow)
-
-    escrow.total_locked += amount
+        escrow = Escrow(project_id=p.id, total_locked=amount, total_released=0)
+    else:
+        escrow.total_locked = Escrow.total_locked + amount
 
     # holding
-    holding = TokenHolding.query.filter_by(
-        user_id=auth_user["user_id"],
-        project_id=p.id
-    ).first()
-
     if not holding:
         holding = TokenHolding(
             user_id=auth_user["user_id"],
@@ -261,7 +298,6 @@ def invest():
             token_count=0,
             avg_buy_price=0
         )
-        db.session.add(holding)
 
     old_total = holding.token_count * holding.avg_buy_price
     new_total = old_total + (tokens * p.token_price)
@@ -278,7 +314,7 @@ def invest():
         token_count=tokens,
         status="SUCCESS"
     )
-    db.session.add(tx)
+    db.session.add_all([escrow, holding, tx])
     db.session.commit()
 
     return jsonify({
@@ -294,14 +330,17 @@ def portfolio():
     if not auth_user:
         return jsonify({"error": "Unauthorized"}), 401
 
-    holdings = TokenHolding.query.filter_by(user_id=auth_user["user_id"]).all()
+    # ✅ one JOIN instead of a Project lookup per holding
+    holdings = (
+        TokenHolding.query
+        .options(joinedload(TokenHolding.project, innerjoin=True))
+        .filter_by(user_id=auth_user["user_id"])
+        .all()
+    )
     res = []
 
     for h in holdings:
-        p = Project.query.get(h.project_id)
-        if not p:
-            continue
-
+        p = h.project
         res.append({
             "project_id": p.id,
             "project_title": p.title,
@@ -323,6 +362,7 @@ def investor_transactions():
 
     txs = (
         Transaction.query
+        .options(joinedload(Transaction.project))
         .filter_by(user_id=auth_user["user_id"])
         .order_by(Transaction.created_at.desc())
         .all()
@@ -330,7 +370,7 @@ def investor_transactions():
 
     result = []
     for t in txs:
-        p = Project.query.get(t.project_id) if t.project_id else None
+        p = t.project
         result.append({
             "tx_hash": t.tx_hash,
             "type": t.tx_type,
@@ -383,18 +423,23 @@ def list_tokens_for_sale():
 
 @app.get("/api/marketplace/listings")
 def marketplace_listings():
-    listings = MarketplaceListing.query.filter_by(status="ACTIVE").all()
+    # ✅ single JOIN; listings of inactive projects are filtered in SQL
+    listings = (
+        MarketplaceListing.query
+        .join(MarketplaceListing.project)
+        .join(MarketplaceListing.seller)
+        .options(
+            contains_eager(MarketplaceListing.project),
+            contains_eager(MarketplaceListing.seller)
+        )
+        .filter(MarketplaceListing.status == "ACTIVE", Project.status == "ACTIVE")
+        .all()
+    )
     result = []
 
     for l in listings:
-        p = Project.query.get(l.project_id)
-        seller = User.query.get(l.seller_id)
-        if not p or not seller:
-            continue
-
-        if p.status != "ACTIVE":
-            continue
-
+        p = l.project
+        seller = l.seller
         result.append({
             "id": l.id,
             "project_id": p.id,
@@ -475,32 +520,59 @@ def buy_listing():
 
 
 # ---------- PDF CERTIFICATE ----------
+def _store_certificate(bio, file_path, family_glob):
+    # ✅ best-effort cache write: the response is served from `bio` either way
+    # unique temp file per writer: threads of one worker never share it
+    tmp_path = None
+    try:
+        fd, tmp_path = tempfile.mkstemp(dir=PDF_DIR, suffix=".tmp")
+        with os.fdopen(fd, "wb") as out:
+            out.write(bio.getbuffer())
+        os.replace(tmp_path, file_path)
+    except OSError:
+        app.logger.warning("could not cache certificate %s", file_path, exc_info=True)
+        if tmp_path:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+        return
+
+    # ✅ keep only the current signature per (user, project)
+    for stale in glob.glob(os.path.join(PDF_DIR, family_glob)):
+        if stale != file_path:
+            try:
+                os.remove(stale)
+            except FileNotFoundError:
+                pass
+
+
 @app.get("/api/investor/certificate/<int:project_id>")
 def download_certificate(project_id):
     auth_user = get_auth_user()
     if not auth_user:
         return jsonify({"error": "Unauthorized"}), 401
 
-    user = User.query.get(auth_user["user_id"])
+    user = get_cached_user(auth_user["user_id"])
     if not user:
         return jsonify({"error": "Unauthorized"}), 401
 
     project = Project.query.get_or_404(project_id)
 
-    holding = TokenHolding.query.filter_by(user_id=user.id, project_id=project.id).first()
+    holding = TokenHolding.query.filter_by(user_id=user["id"], project_id=project.id).first()
     if not holding or holding.token_count <= 0:
         return jsonify({"error": "No tokens found for this project"}), 400
 
     tx = (
         Transaction.query
-        .filter_by(user_id=user.id, project_id=project.id)
+        .filter_by(user_id=user["id"], project_id=project.id)
         .order_by(Transaction.created_at.desc())
         .first()
     )
     tx_hash = tx.tx_hash if tx else generate_tx_hash()
 
     pdf_data = {
-        "investor_name": user.name,
+        "investor_name": user["name"],
         "project_title": project.title,
         "amount_invested": int(holding.token_count * project.token_price),
         "tokens_issued": holding.token_count,
@@ -510,11 +582,37 @@ def download_certificate(project_id):
         "tx_hash": tx_hash
     }
 
-    os.makedirs("generated_pdfs", exist_ok=True)
-    file_path = f"generated_pdfs/certificate_{user.id}_{project.id}.pdf"
-    generate_certificate_pdf(pdf_data, file_path)
+    # ✅ reuse the PDF while everything printed on it is unchanged
+    sig = hashlib.blake2b(
+        repr(sorted(pdf_data.items())).encode(), digest_size=8
+    ).hexdigest()
+
+    file_path = os.path.join(PDF_DIR, f"cert_{user['id']}_{project.id}_{sig}.pdf")
+    download_name = f"certificate_{user['id']}_{project.id}.pdf"
+
+    try:
+        return send_file(
+            file_path,
+            as_attachment=True,
+            download_name=download_name,
+            conditional=True
+        )
+    except FileNotFoundError:
+        pass  # not cached yet, or just superseded -> render below
+
+    # ✅ render in memory and answer from the buffer; disk only keeps the cache copy
+    bio = io.BytesIO()
+    generate_certificate_pdf(pdf_data, bio)
 
-    return send_file(file_path, as_attachment=True)
+    _store_certificate(bio, file_path, f"cert_{user['id']}_{project.id}_*.pdf")
+
+    bio.seek(0)
+    return send_file(
+        bio,
+        mimetype="application/pdf",
+        as_attachment=True,
+        download_name=download_name
+    )
 
 
 # ---------- ISSUER: CREATE PROJECT ----------
@@ -627,23 +725,13 @@ def issuer_projects():
 
     projects = (
         Project.query
+        .options(project_columns(Project.ISSUER_LIST_FIELDS))
         .filter_by(issuer_id=auth_user["user_id"])
         .order_by(Project.id.desc())
         .all()
     )
 
-    return jsonify([{
-        "id": p.id,
-        "title": p.title,
-        "location": p.location,
-        "funding_raised": p.funding_raised,
-        "funding_target": p.funding_target,
-        "token_price": p.token_price,
-        "roi_percent": p.roi_percent,
-        "tenure_months": p.tenure_months,
-        "risk_score": p.risk_score,
-        "status": p.status
-    } for p in projects])
+    return jsonify([p.to_dict(Project.ISSUER_LIST_FIELDS) for p in projects])
 
 
 # ---------- ISSUER: SUBMIT MILESTONE PROOF ----------
@@ -658,8 +746,14 @@ def issuer_submit_milestone_proof(milestone_id):
     data = request.json or {}
     proof_url = (data.get("proof_url") or "").strip()
 
-    milestone = Milestone.query.get_or_404(milestone_id)
-    project = Project.query.get(milestone.project_id)
+    # ✅ milestone + project + escrow in one round-trip
+    milestone, project, escrow = (
+        db.session.query(Milestone, Project, Escrow)
+        .outerjoin(Project, Project.id == Milestone.project_id)
+        .outerjoin(Escrow, Escrow.project_id == Milestone.project_id)
+        .filter(Milestone.id == milestone_id)
+        .first_or_404()
+    )
 
     if not project:
         return jsonify({"error": "Project not found"}), 404
@@ -673,20 +767,40 @@ def issuer_submit_milestone_proof(milestone_id):
     if milestone.status == "COMPLETED":
         return jsonify({"message": "Already completed"}), 200
 
-    milestone.status = "COMPLETED"
-    milestone.proof_url = proof_url
-
-    escrow = Escrow.query.filter_by(project_id=project.id).first()
-    if not escrow:
-        escrow = Escrow(project_id=project.id, total_locked=0, total_released=0)
-        db.session.add(escrow)
-
-    release_amount = int((escrow.total_locked * milestone.escrow_release_percent) / 100)
-    if release_amount > escrow.total_locked:
-        release_amount = escrow.total_locked
+    # ✅ guarded UPDATE: only one concurrent submit can complete the milestone
+    completed = (
+        Milestone.query
+        .filter(Milestone.id == milestone.id, Milestone.status != "COMPLETED")
+        .update({"status": "COMPLETED", "proof_url": proof_url}, synchronize_session=False)
+    )
+    if not completed:
+        db.session.rollback()
+        return jsonify({"message": "Already completed"}), 200
 
-    escrow.total_locked -= release_amount
-    escrow.total_released += release_amount
+    release_amount = 0
+    if escrow:
+        # ✅ lock the escrow row and read its current balance: a concurrent
+        # submit for another milestone of this project waits here, so the
+        # amount is this release alone (FOR UPDATE is a no-op on SQLite,
+        # which already holds the write lock from the UPDATE above)
+        locked = db.session.execute(
+            select(Escrow.total_locked)
+            .where(Escrow.id == escrow.id)
+            .with_for_update()
+        ).scalar_one()
+        release_percent = min(milestone.escrow_release_percent, 100)
+        release_amount = locked * release_percent // 100
+        db.session.execute(
+            update(Escrow)
+            .where(Escrow.id == escrow.id)
+            .values(
+                total_locked=Escrow.total_locked - release_amount,
+                total_released=Escrow.total_released + release_amount
+            )
+            .execution_options(synchronize_session=False)
+        )
+    else:
+        db.session.add(Escrow(project_id=project.id, total_locked=0, total_released=0))
 
     db.session.commit()
 
@@ -708,24 +822,13 @@ def admin_list_projects():
 
     status = (request.args.get("status") or "").upper().strip()
 
-    q = Project.query
+    q = Project.query.options(project_columns(Project.ADMIN_LIST_FIELDS))
     if status:
         q = q.filter(Project.status == status)
 
     projects = q.order_by(Project.id.desc()).all()
 
-    return jsonify([{
-        "id": p.id,
-        "title": p.title,
-        "location": p.location,
-        "category": p.category,
-        "funding_target": p.funding_target,
-        "funding_raised": p.funding_raised,
-        "roi_percent": p.roi_percent,
-        "tenure_months": p.tenure_months,
-        "risk_score": p.risk_score,
-        "status": p.status
-    } for p in projects])
+    return jsonify([p.to_dict(Project.ADMIN_LIST_FIELDS) for p in projects])
 
 
 # ✅ Admin: Full project details + milestones (ONLY ONE ROUTE)
@@ -737,31 +840,22 @@ def admin_project_details(project_id):
     if auth_user["role"] != "ADMIN":
         return jsonify({"error": "Forbidden"}), 403
 
-    p = Project.query.get_or_404(project_id)
-    milestones = (
-        Milestone.query
-        .filter_by(project_id=p.id)
+    # ✅ project + its milestones in one JOIN
+    rows = (
+        db.session.query(Project, Milestone)
+        .outerjoin(Milestone, Milestone.project_id == Project.id)
+        .filter(Project.id == project_id)
         .order_by(Milestone.id.asc())
         .all()
     )
+    if not rows:
+        abort(404)
+
+    p = rows[0][0]
+    milestones = [m for _, m in rows if m is not None]
 
     return jsonify({
-        "project": {
-            "id": p.id,
-            "title": p.title,
-            "location": p.location,
-            "category": p.category,
-            "description": p.description,
-            "funding_target": p.funding_target,
-            "funding_raised": p.funding_raised,
-            "token_price": p.token_price,
-            "roi_percent": p.roi_percent,
-            "tenure_months": p.tenure_months,
-            "risk_level": p.risk_level,
-            "risk_score": p.risk_score,
-            "status": p.status,
-            "issuer_id": p.issuer_id
-        },
+        "project": p.to_dict(Project.ADMIN_DETAIL_FIELDS),
         "milestones": [
             {
                 "id": m.id,
@@ -806,24 +900,40 @@ def admin_fraud_alerts():
     if auth_user["role"] != "ADMIN":
         return jsonify({"error": "Forbidden"}), 403
 
-    projects = Project.query.all()
+    # ✅ only alerting projects leave the DB, as plain (id, title, flags) rows
+    high_roi = Project.roi_percent >= 14
+    funding_spike = db.and_(
+        Project.funding_target > 0,
+        Project.funding_raised > Project.funding_target * 0.95
+    )
+    rows = (
+        db.session.query(
+            Project.id,
+            Project.title,
+            db.case((high_roi, True), else_=False),
+            db.case((funding_spike, True), else_=False)
+        )
+        .filter(db.or_(high_roi, funding_spike))
+        .order_by(Project.id.asc())
+        .all()
+    )
     alerts = []
 
-    for p in projects:
-        if p.roi_percent >= 14:
+    for project_id, project_title, is_high_roi, is_funding_spike in rows:
+        if is_high_roi:
             alerts.append({
                 "type": "HIGH_ROI_ALERT",
-                "project_id": p.id,
-                "project_title": p.title,
+                "project_id": project_id,
+                "project_title": project_title,
                 "message": "Unusually high ROI detected (possible risk)",
                 "severity": "HIGH"
             })
 
-        if p.funding_target > 0 and (p.funding_raised / p.funding_target) > 0.95:
+        if is_funding_spike:
             alerts.append({
                 "type": "FUNDING_SPIKE",
-                "project_id": p.id,
-                "project_title": p.title,
+                "project_id": project_id,
+                "project_title": project_title,
                 "message": "Project nearing full funding rapidly",
                 "severity": "MEDIUM"
             })
@@ -832,4 +942,5 @@ def admin_fraud_alerts():
 
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=True)
+    # dev server only; production runs gunicorn -c gunicorn_conf.py app:app
+    app.run(host="0.0.0.0", port=5000, debug=os.getenv("FLASK_DEBUG") == "1")
@@ -0,0 +1,19 @@
+import os
+
+# Production entrypoint:  gunicorn -c gunicorn_conf.py app:app
+
+bind = os.getenv("BIND", "0.0.0.0:5000")
+workers = int(os.getenv("WEB_CONCURRENCY", (os.cpu_count() or 1) * 2 + 1))
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+
+# ✅ import app.py (create_all) once in the master, before forking
+preload_app = True
+
+
+def post_fork(server, worker):
+    # ✅ workers must not reuse DB connections opened by the master
+    from app import app, db
+
+    with app.app_context():
+        db.engine.dispose(close=False)
@@ -1,4 +1,5 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.orm import validates
 from datetime import datetime
 
 db = SQLAlchemy()
@@ -12,8 +13,29 @@ class User(db.Model):
     role = db.Column(db.String(20))  # INVESTOR / ISSUER / ADMIN
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    # ✅ roles are stored upper-case, so tokens and checks never re-normalize
+    @validates("role")
+    def _normalize_role(self, key, role):
+        return role.upper() if role else role
+
 
 class Project(db.Model):
+    # JSON field sets used by the API endpoints
+    PUBLIC_FIELDS = (
+        "id", "title", "category", "location", "description",
+        "funding_target", "funding_raised", "token_price", "roi_percent",
+        "tenure_months", "risk_level", "risk_score", "status",
+    )
+    ADMIN_DETAIL_FIELDS = PUBLIC_FIELDS + ("issuer_id",)
+    ADMIN_LIST_FIELDS = (
+        "id", "title", "location", "category", "funding_target",
+        "funding_raised", "roi_percent", "tenure_months", "risk_score", "status",
+    )
+    ISSUER_LIST_FIELDS = (
+        "id", "title", "location", "funding_raised", "funding_target",
+        "token_price", "roi_percent", "tenure_months", "risk_score", "status",
+    )
+
     id = db.Column(db.Integer, primary_key=True)
 
     # issuer linkage
@@ -28,21 +50,29 @@ class Project(db.Model):
     funding_raised = db.Column(db.Integer, default=0)
 
     token_price = db.Column(db.Integer, default=100)
-    roi_percent = db.Column(db.Float, default=12.0)
+    roi_percent = db.Column(db.Float, default=12.0, index=True)
     tenure_months = db.Column(db.Integer, default=24)
 
     risk_level = db.Column(db.String(20), default="MEDIUM")
     risk_score = db.Column(db.Integer, default=55)
 
     # PENDING / ACTIVE / FROZEN
-    status = db.Column(db.String(30), default="PENDING")
+    status = db.Column(db.String(30), default="PENDING", index=True)
 
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    holdings = db.relationship("TokenHolding", back_populates="project")
+    transactions = db.relationship("Transaction", back_populates="project")
+
+    def to_dict(self, fields=PUBLIC_FIELDS):
+        # loaded columns come straight from __dict__; expired ones via getattr
+        d = self.__dict__
+        return {k: d[k] if k in d else getattr(self, k) for k in fields}
+
 
 class Milestone(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    project_id = db.Column(db.Integer, db.ForeignKey("project.id"))
+    project_id = db.Column(db.Integer, db.ForeignKey("project.id"), index=True)
 
     title = db.Column(db.String(200))
     escrow_release_percent = db.Column(db.Integer, default=20)
@@ -64,16 +94,26 @@ class Escrow(db.Model):
 
 
 class TokenHolding(db.Model):
+    __table_args__ = (
+        db.Index("ix_th_user_project", "user_id", "project_id"),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"))
     project_id = db.Column(db.Integer, db.ForeignKey("project.id"))
     token_count = db.Column(db.Integer, default=0)
     avg_buy_price = db.Column(db.Float, default=0.0)
 
+    project = db.relationship("Project", back_populates="holdings")
+
 
 class Transaction(db.Model):
+    __table_args__ = (
+        db.Index("ix_tx_user_created", "user_id", "created_at"),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
-    tx_hash = db.Column(db.String(100))
+    tx_hash = db.Column(db.String(100), unique=True, index=True)
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"))
     project_id = db.Column(db.Integer, db.ForeignKey("project.id"))
     tx_type = db.Column(db.String(30))  # MINT / TRANSFER etc.
@@ -82,6 +122,8 @@ class Transaction(db.Model):
     status = db.Column(db.String(30), default="SUCCESS")
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    project = db.relationship("Project", back_populates="transactions")
+
 
 class MarketplaceListing(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -89,5 +131,8 @@ class MarketplaceListing(db.Model):
     project_id = db.Column(db.Integer, db.ForeignKey("project.id"))
     token_count = db.Column(db.Integer)
     price_per_token = db.Column(db.Integer)
-    status = db.Column(db.String(30), default="ACTIVE")  # ACTIVE/SOLD
+    status = db.Column(db.String(30), default="ACTIVE", index=True)  # ACTIVE/SOLD
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    project = db.relationship("Project")
+    seller = db.relationship("User")
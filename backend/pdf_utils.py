@@ -3,15 +3,17 @@ from reportlab.pdfgen import canvas
 import os
 from datetime import datetime
 
-def generate_certificate_pdf(data, output_path):
-    c = canvas.Canvas(output_path, pagesize=A4)
-    width, height = A4
+PAGE_WIDTH, PAGE_HEIGHT = A4
+TITLE_FONT = ("Helvetica-Bold", 18)
+BODY_FONT = ("Helvetica", 12)
+BODY_LEADING = 18
 
-    c.setFont("Helvetica-Bold", 18)
-    c.drawString(50, height - 60, "InfraBondX Investment Certificate")
+def generate_certificate_pdf(data, output):
+    # output: file path or binary file-like object (e.g. io.BytesIO)
+    c = canvas.Canvas(output, pagesize=A4)
 
-    c.setFont("Helvetica", 12)
-    y = height - 110
+    c.setFont(*TITLE_FONT)
+    c.drawString(50, PAGE_HEIGHT - 60, "InfraBondX Investment Certificate")
 
     lines = [
         f"Investor Name: {data['investor_name']}",
@@ -28,9 +30,11 @@ def generate_certificate_pdf(data, output_path):
         "No real money or regulated securities are involved in this demo.",
     ]
 
-    for line in lines:
-        c.drawString(50, y, line)
-        y -= 18
+    # ✅ one text object instead of a drawString per line
+    text = c.beginText(50, PAGE_HEIGHT - 110)
+    text.setFont(*BODY_FONT, leading=BODY_LEADING)
+    text.textLines(lines)
+    c.drawText(text)
 
     c.showPage()
     c.save()
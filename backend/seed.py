@@ -1,228 +1,260 @@
+import io
+from datetime import datetime
+
 from models import db, User, Project, Milestone, Escrow
-from werkzeug.security import generate_password_hash
+
+# ✅ dev seed credentials only: precomputed generate_password_hash() output for
+# admin123 / issuer123 / investor123, so seeding does no KDF work at all
+ADMIN_PW_HASH = "scrypt:32768:8:1$5yWLQ0ooxcBCS0Ab$aaf01c410d06661fb4e2279d313068ad08826ead6ba0e82a9928c1e3e7df710eefbdebf73c498fc9d04e57de2ec1e4a8bfb7e4940ff56850ad92d725c97cef23"
+ISSUER_PW_HASH = "scrypt:32768:8:1$sdDvEOO9TYYOtJdG$278597eccedab0363aecb4d0c63bb14e1f80d02ca94f360c2c2119494da3b45cfa4e6f0c256be55a3d3bb5df872e60f10848758662ded0e0f43ad9283120f03a"
+INVESTOR_PW_HASH = "scrypt:32768:8:1$LnRIzRRqZd1MqYmM$c14b9f98c0d85fb57c307698dea192031cf6fd22c155f1aa7d95f4b85461e36defc31a9ea82d8d2b810ac1ec36e53d2d5340b7dc8aa0aeac3813b2c2825888a0"
+
+# pg_advisory_xact_lock key shared by every worker that may run seed_data()
+SEED_LOCK_KEY = 0x1B0D5EED
+
+# (title, escrow_release_percent, status) created for every seeded project
+MILESTONE_TEMPLATE = (
+    ("Tender Approved", 20, "COMPLETED"),
+    ("Construction Started", 20, "COMPLETED"),
+    ("25% Completion Proof", 20, "PENDING"),
+    ("50% Completion Proof", 20, "PENDING"),
+    ("Audit & Completion Report", 20, "PENDING"),
+)
+
+
+# ---------------- PROJECTS (MOCK DATA) ----------------
+# ✅ plain column dicts for bulk_insert_mappings; issuer_id is added at seed time
+PROJECT_ROWS = (
+    # ACTIVE
+    dict(
+        title="Raipur Smart Road Phase-2",
+        category="Road",
+        location="Raipur, Chhattisgarh",
+        description="Upgrading 12km road with smart streetlights, drainage and safety upgrades.",
+        funding_target=5000000,
+        funding_raised=1250000,
+        token_price=100,
+        roi_percent=11.5,
+        tenure_months=24,
+        risk_level="MEDIUM",
+        risk_score=58,
+        status="ACTIVE"
+    ),
+    dict(
+        title="Bilaspur Bridge Strengthening Program",
+        category="Bridge",
+        location="Bilaspur, Chhattisgarh",
+        description="Structural strengthening of an old bridge and monitoring improvements.",
+        funding_target=8000000,
+        funding_raised=2800000,
+        token_price=100,
+        roi_percent=12.8,
+        tenure_months=36,
+        risk_level="LOW",
+        risk_score=42,
+        status="ACTIVE"
+    ),
+
+    # ACTIVE - Other states
+    dict(
+        title="Mumbai Coastal Drainage Upgrade",
+        category="Drainage",
+        location="Mumbai, Maharashtra",
+        description="Stormwater drainage modernization for monsoon resilience.",
+        funding_target=15000000,
+        funding_raised=7200000,
+        token_price=100,
+        roi_percent=12.2,
+        tenure_months=30,
+        risk_level="MEDIUM",
+        risk_score=55,
+        status="ACTIVE"
+    ),
+    dict(
+        title="Bengaluru Smart Streetlight Network",
+        category="Energy",
+        location="Bengaluru, Karnataka",
+        description="LED smart streetlights with remote monitoring and energy analytics.",
+        funding_target=9000000,
+        funding_raised=4100000,
+        token_price=100,
+        roi_percent=11.2,
+        tenure_months=24,
+        risk_level="LOW",
+        risk_score=40,
+        status="ACTIVE"
+    ),
+    dict(
+        title="Ahmedabad EV Charging Corridors",
+        category="Transport",
+        location="Ahmedabad, Gujarat",
+        description="Deployment of EV charging points across city corridors and highways.",
+        funding_target=12000000,
+        funding_raised=5900000,
+        token_price=100,
+        roi_percent=13.2,
+        tenure_months=36,
+        risk_level="MEDIUM",
+        risk_score=60,
+        status="ACTIVE"
+    ),
+    dict(
+        title="Hyderabad Water Pipeline Rehabilitation",
+        category="Water",
+        location="Hyderabad, Telangana",
+        description="Pipeline leak reduction + sensor monitoring for urban water supply.",
+        funding_target=11000000,
+        funding_raised=3500000,
+        token_price=100,
+        roi_percent=11.0,
+        tenure_months=30,
+        risk_level="LOW",
+        risk_score=44,
+        status="ACTIVE"
+    ),
+    dict(
+        title="Jaipur Heritage Zone Road Resurfacing",
+        category="Road",
+        location="Jaipur, Rajasthan",
+        description="Resurfacing + pedestrian safety upgrades in heritage zones.",
+        funding_target=6000000,
+        funding_raised=2400000,
+        token_price=100,
+        roi_percent=10.8,
+        tenure_months=24,
+        risk_level="LOW",
+        risk_score=38,
+        status="ACTIVE"
+    ),
+    dict(
+        title="Kolkata Riverfront Safety Barriers",
+        category="Safety",
+        location="Kolkata, West Bengal",
+        description="Safety barrier installations and lighting along riverfront stretches.",
+        funding_target=7000000,
+        funding_raised=3200000,
+        token_price=100,
+        roi_percent=12.0,
+        tenure_months=24,
+        risk_level="MEDIUM",
+        risk_score=50,
+        status="ACTIVE"
+    ),
+
+    # PENDING (admin approval demo)
+    dict(
+        title="Lucknow Smart Traffic Signal System",
+        category="Smart City",
+        location="Lucknow, Uttar Pradesh",
+        description="Adaptive traffic signals with AI-based congestion control.",
+        funding_target=9500000,
+        funding_raised=0,
+        token_price=100,
+        roi_percent=12.5,
+        tenure_months=30,
+        risk_level="MEDIUM",
+        risk_score=52,
+        status="PENDING"
+    ),
+    dict(
+        title="Chennai Flood-Resilient Underpass Upgrade",
+        category="Drainage",
+        location="Chennai, Tamil Nadu",
+        description="Underpass drainage strengthening and water pump automation.",
+        funding_target=13000000,
+        funding_raised=0,
+        token_price=100,
+        roi_percent=14.2,  # ✅ fraud alert trigger
+        tenure_months=36,
+        risk_level="HIGH",
+        risk_score=70,
+        status="PENDING"
+    ),
+    dict(
+        title="Indore Smart Waste Processing Plant",
+        category="Waste Management",
+        location="Indore, Madhya Pradesh",
+        description="Waste-to-energy processing and automated segregation facilities.",
+        funding_target=14000000,
+        funding_raised=0,
+        token_price=100,
+        roi_percent=12.9,
+        tenure_months=36,
+        risk_level="MEDIUM",
+        risk_score=57,
+        status="PENDING"
+    ),
+    dict(
+        title="Bhopal Lake Water Quality Sensors",
+        category="Water",
+        location="Bhopal, Madhya Pradesh",
+        description="Real-time lake water quality sensors + dashboard monitoring.",
+        funding_target=4000000,
+        funding_raised=0,
+        token_price=100,
+        roi_percent=10.5,
+        tenure_months=18,
+        risk_level="LOW",
+        risk_score=33,
+        status="PENDING"
+    ),
+)
 
 
 def seed_data():
+    """Seed an empty database; returns False if users already exist."""
+    dialect = db.engine.dialect.name
+
+    # ✅ serialize concurrent workers: whoever gets the lock seeds, the rest
+    # then see the users below; both locks are released at commit/rollback
+    if dialect == "postgresql":
+        db.session.execute(db.text("SELECT pg_advisory_xact_lock(:k)"), {"k": SEED_LOCK_KEY})
+    elif dialect == "sqlite":
+        db.session.execute(db.text("BEGIN IMMEDIATE"))
+
     # do not seed again if users already exist
-    if User.query.first():
-        return
+    # ✅ SELECT EXISTS(...) -> one boolean, no User row to hydrate
+    if db.session.query(db.session.query(User).exists()).scalar():
+        db.session.rollback()
+        return False
+
+    # ✅ Postgres: don't wait for WAL fsync on this throwaway bulk load;
+    # LOCAL reverts at commit so normal app traffic stays durable
+    if dialect == "postgresql":
+        db.session.execute(db.text("SET LOCAL synchronous_commit = OFF"))
 
     # ---------------- USERS ----------------
     admin = User(
         name="Admin",
         email="admin@infrabondx.com",
-        password_hash=generate_password_hash("admin123"),
+        password_hash=ADMIN_PW_HASH,
         role="ADMIN"
     )
 
     issuer = User(
         name="Raipur Smart Infra Dept",
         email="issuer@infrabondx.com",
-        password_hash=generate_password_hash("issuer123"),
+        password_hash=ISSUER_PW_HASH,
         role="ISSUER"
     )
 
     investor = User(
         name="Mandeep Kumar",
         email="investor@infrabondx.com",
-        password_hash=generate_password_hash("investor123"),
+        password_hash=INVESTOR_PW_HASH,
         role="INVESTOR"
     )
 
     db.session.add_all([admin, issuer, investor])
-    db.session.commit()
+    # ✅ flush (not commit) for PKs; the whole seed is one transaction
+    db.session.flush()
 
     # ---------------- PROJECTS (MOCK DATA) ----------------
-    projects = [
-        # ACTIVE
-        Project(
-            issuer_id=issuer.id,
-            title="Raipur Smart Road Phase-2",
-            category="Road",
-            location="Raipur, Chhattisgarh",
-            description="Upgrading 12km road with smart streetlights, drainage and safety upgrades.",
-            funding_target=5000000,
-            funding_raised=1250000,
-            token_price=100,
-            roi_percent=11.5,
-            tenure_months=24,
-            risk_level="MEDIUM",
-            risk_score=58,
-            status="ACTIVE"
-        ),
-        Project(
-            issuer_id=issuer.id,
-            title="Bilaspur Bridge Strengthening Program",
-            category="Bridge",
-            location="Bilaspur, Chhattisgarh",
-            description="Structural strengthening of an old bridge and monitoring improvements.",
-            funding_target=8000000,
-            funding_raised=2800000,
-            token_price=100,
-            roi_percent=12.8,
-            tenure_months=36,
-            risk_level="LOW",
-            risk_score=42,
-            status="ACTIVE"
-        ),
-
-        # ACTIVE - Other states
-        Project(
-            issuer_id=issuer.id,
-            title="Mumbai Coastal Drainage Upgrade",
-            category="Drainage",
-            location="Mumbai, Maharashtra",
-            description="Stormwater drainage modernization for monsoon resilience.",
-            funding_target=15000000,
-            funding_raised=7200000,
-            token_price=100,
-            roi_percent=12.2,
-            tenure_months=30,
-            risk_level="MEDIUM",
-            risk_score=55,
-            status="ACTIVE"
-        ),
-        Project(
-            issuer_id=issuer.id,
-            title="Bengaluru Smart Streetlight Network",
-            category="Energy",
-            location="Bengaluru, Karnataka",
-            description="LED smart streetlights with remote monitoring and energy analytics.",
-            funding_target=9000000,
-            funding_raised=4100000,
-            token_price=100,
-            roi_percent=11.2,
-            tenure_months=24,
-            risk_level="LOW",
-            risk_score=40,
-            status="ACTIVE"
-        ),
-        Project(
-            issuer_id=issuer.id,
-            title="Ahmedabad EV Charging Corridors",
-            category="Transport",
-            location="Ahmedabad, Gujarat",
-            description="Deployment of EV charging points across city corridors and highways.",
-            funding_target=12000000,
-            funding_raised=5900000,
-            token_price=100,
-            roi_percent=13.2,
-            tenure_months=36,
-            risk_level="MEDIUM",
-            risk_score=60,
-            status="ACTIVE"
-        ),
-        Project(
-            issuer_id=issuer.id,
-            title="Hyderabad Water Pipeline Rehabilitation",
-            category="Water",
-            location="Hyderabad, Telangana",
-            description="Pipeline leak reduction + sensor monitoring for urban water supply.",
-            funding_target=11000000,
-            funding_raised=3500000,
-            token_price=100,
-            roi_percent=11.0,
-            tenure_months=30,
-            risk_level="LOW",
-            risk_score=44,
-            status="ACTIVE"
-        ),
-        Project(
-            issuer_id=issuer.id,
-            title="Jaipur Heritage Zone Road Resurfacing",
-            category="Road",
-            location="Jaipur, Rajasthan",
-            description="Resurfacing + pedestrian safety upgrades in heritage zones.",
-            funding_target=6000000,
-            funding_raised=2400000,
-            token_price=100,
-            roi_percent=10.8,
-            tenure_months=24,
-            risk_level="LOW",
-            risk_score=38,
-            status="ACTIVE"
-        ),
-        Project(
-            issuer_id=issuer.id,
-            title="Kolkata Riverfront Safety Barriers",
-            category="Safety",
-            location="Kolkata, West Bengal",
-            description="Safety barrier installations and lighting along riverfront stretches.",
-            funding_target=7000000,
-            funding_raised=3200000,
-            token_price=100,
-            roi_percent=12.0,
-            tenure_months=24,
-            risk_level="MEDIUM",
-            risk_score=50,
-            status="ACTIVE"
-        ),
-
-        # PENDING (admin approval demo)
-        Project(
-            issuer_id=issuer.id,
-            title="Lucknow Smart Traffic Signal System",
-            category="Smart City",
-            location="Lucknow, Uttar Pradesh",
-            description="Adaptive traffic signals with AI-based congestion control.",
-            funding_target=9500000,
-            funding_raised=0,
-            token_price=100,
-            roi_percent=12.5,
-            tenure_months=30,
-            risk_level="MEDIUM",
-            risk_score=52,
-            status="PENDING"
-        ),
-        Project(
-            issuer_id=issuer.id,
-            title="Chennai Flood-Resilient Underpass Upgrade",
-            category="Drainage",
-            location="Chennai, Tamil Nadu",
-            description="Underpass drainage strengthening and water pump automation.",
-            funding_target=13000000,
-            funding_raised=0,
-            token_price=100,
-            roi_percent=14.2,  # ✅ fraud alert trigger
-            tenure_months=36,
-            risk_level="HIGH",
-            risk_score=70,
-            status="PENDING"
-        ),
-        Project(
-            issuer_id=issuer.id,
-            title="Indore Smart Waste Processing Plant",
-            category="Waste Management",
-            location="Indore, Madhya Pradesh",
-            description="Waste-to-energy processing and automated segregation facilities.",
-            funding_target=14000000,
-            funding_raised=0,
-            token_price=100,
-            roi_percent=12.9,
-            tenure_months=36,
-            risk_level="MEDIUM",
-            risk_score=57,
-            status="PENDING"
-        ),
-        Project(
-            issuer_id=issuer.id,
-            title="Bhopal Lake Water Quality Sensors",
-            category="Water",
-            location="Bhopal, Madhya Pradesh",
-            description="Real-time lake water quality sensors + dashboard monitoring.",
-            funding_target=4000000,
-            funding_raised=0,
-            token_price=100,
-            roi_percent=10.5,
-            tenure_months=18,
-            risk_level="LOW",
-            risk_score=33,
-            status="PENDING"
-        ),
-    ]
-
-    db.session.add_all(projects)
-    db.session.commit()
+    # copies, so return_defaults filling in "id" never touches PROJECT_ROWS
+    projects = [dict(row, issuer_id=issuer.id) for row in PROJECT_ROWS]
+
+    # ✅ batched INSERT; return_defaults fills each dict's "id" for the FKs below
+    db.session.bulk_insert_mappings(Project, projects, return_defaults=True)
 
     # ---------------- ESCROW + MILESTONES ----------------
     escrows = []
@@ -230,17 +262,42 @@ def seed_data():
 
     for p in projects:
         escrows.append(
-            Escrow(project_id=p.id, total_locked=p.funding_raised, total_released=0)
+            dict(project_id=p["id"], total_locked=p["funding_raised"], total_released=0)
         )
 
-        milestones_all.extend([
-            Milestone(project_id=p.id, title="Tender Approved", escrow_release_percent=20, status="COMPLETED"),
-            Milestone(project_id=p.id, title="Construction Started", escrow_release_percent=20, status="COMPLETED"),
-            Milestone(project_id=p.id, title="25% Completion Proof", escrow_release_percent=20, status="PENDING"),
-            Milestone(project_id=p.id, title="50% Completion Proof", escrow_release_percent=20, status="PENDING"),
-            Milestone(project_id=p.id, title="Audit & Completion Report", escrow_release_percent=20, status="PENDING"),
-        ])
+        milestones_all.extend(
+            dict(project_id=p["id"], title=title, escrow_release_percent=percent, status=status, proof_url=None)
+            for title, percent, status in MILESTONE_TEMPLATE
+        )
 
-    db.session.add_all(escrows)
-    db.session.add_all(milestones_all)
+    # ✅ render_nulls keeps every row's column set identical -> one executemany
+    db.session.bulk_insert_mappings(Escrow, escrows, render_nulls=True)
+    # copy_from is psycopg2-only; psycopg v3 / pg8000 take the executemany path
+    if db.engine.dialect.driver == "psycopg2":
+        _copy_milestones(milestones_all)
+    else:
+        db.session.bulk_insert_mappings(Milestone, milestones_all, render_nulls=True)
     db.session.commit()
+    return True
+
+
+def _copy_milestones(milestones_all):
+    # ✅ Postgres + psycopg2: stream every milestone row in one COPY instead of INSERTs.
+    # Runs on the session's own connection so it shares the seed transaction
+    # (the project rows it references are not committed yet).
+    # COPY skips the ORM, so created_at's Python default is written here.
+    created_at = datetime.utcnow().isoformat()
+    buf = io.StringIO()
+    for m in milestones_all:
+        buf.write(f"{m['project_id']}\t{m['title']}\t{m['escrow_release_percent']}\t{m['status']}\t{created_at}\n")
+    buf.seek(0)
+
+    cursor = db.session.connection().connection.cursor()
+    try:
+        cursor.copy_from(
+            buf,
+            Milestone.__table__.name,
+            columns=("project_id", "title", "escrow_release_percent", "status", "created_at"),
+        )
+    finally:
+        cursor.close()
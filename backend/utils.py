@@ -1,17 +1,84 @@
-import jwt
-from flask import request
+from flask import g, request
+from werkzeug.security import check_password_hash
+from collections import OrderedDict
+import base64
+import hashlib
+import hmac
+import io
+import json
 import os
-import uuid
+import shutil
+import threading
+import time
+
+from models import db, User
 
 JWT_SECRET = os.getenv("JWT_SECRET", "supersecret")
+JWT_SECRET_BYTES = JWT_SECRET.encode()
+JWT_ALGS = ("HS256",)
+
+# ✅ constant header segment, encoded once
+_JWT_HEADER_B64 = b"eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9"  # {"alg":"HS256","typ":"JWT"}
+
+# ✅ recently verified (password_hash, sha256(password)) pairs -> skip the KDF
+_VERIFIED_PASSWORDS = OrderedDict()
+_VERIFIED_PASSWORDS_MAX = 256
+_verified_lock = threading.Lock()
+
+# ✅ user_id -> (public user dict, expires_at); saves a SELECT per request
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", "300"))
+_USER_CACHE = {}
+
+
+class InvalidTokenError(ValueError):
+    """Raised for any malformed, forged or non-HS256 auth token."""
+
+
+def _b64url_encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=")
+
+
+def _b64url_decode(segment):
+    return base64.urlsafe_b64decode(segment + b"=" * (-len(segment) % 4))
 
 
 def create_jwt(user_id, role):
-    return jwt.encode(
-        {"user_id": user_id, "role": str(role).upper()},
-        JWT_SECRET,
-        algorithm="HS256"
-    )
+    payload = json.dumps(
+        {"user_id": user_id, "role": role}, separators=(",", ":")
+    ).encode()
+    signing_input = _JWT_HEADER_B64 + b"." + _b64url_encode(payload)
+    signature = hmac.new(JWT_SECRET_BYTES, signing_input, hashlib.sha256).digest()
+    return (signing_input + b"." + _b64url_encode(signature)).decode()
+
+
+def _verify_hs256(token):
+    """Verify one of our HS256 tokens and return its payload.
+
+    Only checks the header alg and the signature: create_jwt() never sets
+    exp/nbf/iat, so there are no registered claims to validate.
+    """
+    try:
+        signing_input, _, signature_b64 = token.encode("ascii").rpartition(b".")
+        header_b64, _, payload_b64 = signing_input.partition(b".")
+        header = json.loads(_b64url_decode(header_b64))
+        signature = _b64url_decode(signature_b64)
+    except ValueError:
+        raise InvalidTokenError("Invalid token")
+
+    if not isinstance(header, dict) or header.get("alg") not in JWT_ALGS:
+        raise InvalidTokenError("The specified alg value is not allowed")
+
+    expected = hmac.new(JWT_SECRET_BYTES, signing_input, hashlib.sha256).digest()
+    if not hmac.compare_digest(expected, signature):
+        raise InvalidTokenError("Signature verification failed")
+
+    try:
+        payload = json.loads(_b64url_decode(payload_b64))
+    except ValueError:
+        raise InvalidTokenError("Invalid payload")
+    if not isinstance(payload, dict):
+        raise InvalidTokenError("Invalid payload")
+    return payload
 
 
 def get_auth_user():
@@ -19,19 +86,107 @@ def get_auth_user():
     if not auth_header.startswith("Bearer "):
         return None
 
-    token = auth_header.replace("Bearer ", "").strip()
+    token = auth_header[7:].strip()  # 7 == len("Bearer "), checked above
     if not token:
         return None
 
+    # ✅ verify each token once per request, however many times this is called
+    cached = g.get("_auth_user_cache")
+    if cached is not None and token in cached:
+        return cached[token]
+
     try:
-        payload = jwt.decode(token, JWT_SECRET, algorithms=["HS256"])
-        return {
+        payload = _verify_hs256(token)
+    except InvalidTokenError:
+        auth_user = None
+    else:
+        auth_user = {
             "user_id": payload.get("user_id"),
-            "role": (payload.get("role") or "").upper()
+            "role": payload.get("role"),  # already upper-case, see User.role
         }
-    except Exception:
+
+    g._auth_user_cache = {token: auth_user}
+    return auth_user
+
+
+def cache_user(user):
+    data = {"id": user.id, "name": user.name, "email": user.email, "role": user.role}
+    _USER_CACHE[user.id] = (data, time.monotonic() + USER_CACHE_TTL)
+    return data
+
+
+def get_cached_user(user_id):
+    """Public fields of a user, served from memory for USER_CACHE_TTL seconds."""
+    entry = _USER_CACHE.get(user_id)
+    if entry and entry[1] > time.monotonic():
+        return entry[0]
+
+    user = db.session.get(User, user_id) if user_id is not None else None
+    if not user:
+        _USER_CACHE.pop(user_id, None)
         return None
+    return cache_user(user)
+
+
+def verify_password(password_hash, password):
+    """check_password_hash() that remembers recent successful logins.
+
+    Entries are keyed by the stored hash, so a password change invalidates
+    them, and only a SHA-256 of the password is kept in memory.
+    """
+    if not password_hash:
+        return False
+
+    key = (password_hash, hashlib.sha256(password.encode()).digest())
+    with _verified_lock:
+        if key in _VERIFIED_PASSWORDS:
+            _VERIFIED_PASSWORDS.move_to_end(key)
+            return True
+
+    if not check_password_hash(password_hash, password):
+        return False
+
+    with _verified_lock:
+        _VERIFIED_PASSWORDS[key] = True
+        if len(_VERIFIED_PASSWORDS) > _VERIFIED_PASSWORDS_MAX:
+            _VERIFIED_PASSWORDS.popitem(last=False)
+    return True
+
+
+def save_upload(file_storage, save_path, buffer_size=1024 * 1024):
+    """Copy an uploaded file to disk, holding at most buffer_size in memory."""
+    src = file_storage.stream
+    start = src.tell()
+    size = src.seek(0, os.SEEK_END)
+    src.seek(start)
+
+    with open(save_path, "wb", buffering=0) as dst:
+        # ✅ in-memory streams (BytesIO, or a Werkzeug spool still under its
+        # rollover size) or a single buffer's worth -> plain copy; calling
+        # fileno() on a small spool would force it onto disk first
+        if isinstance(src, io.BytesIO) or size - start <= buffer_size or not hasattr(os, "sendfile"):
+            shutil.copyfileobj(src, dst, buffer_size)
+            return
+
+        # ✅ bigger uploads are already on disk -> kernel-side copy
+        try:
+            src_fd = src.fileno()
+            offset = start
+            while offset < size:
+                sent = os.sendfile(dst.fileno(), src_fd, offset, size - offset)
+                if sent == 0:
+                    break
+                offset += sent
+            return
+        except OSError:
+            # sendfile refused this fd pair (e.g. macOS needs a socket) -> plain copy
+            src.seek(start)
+            dst.seek(0)
+            dst.truncate()
+
+        shutil.copyfileobj(src, dst, buffer_size)
 
 
 def generate_tx_hash():
-    return "0x" + uuid.uuid4().hex
+    # ✅ 128 random bits straight from the OS CSPRNG, no UUID object
+    return "0x" + os.urandom(16).hex()